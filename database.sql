@@ -550,6 +550,292 @@ call migrate(
 
 
 
+-- 13
+call migrate(
+  $migrate$
+
+  create index events_modified_idx on events (modified);
+
+  $migrate$
+);
+
+-- 14
+call migrate(
+  $migrate$
+
+  create index executions_begin_timestamp_idx on executions (begin_timestamp);
+  create index executions_end_timestamp_idx on executions (COALESCE(end_timestamp, 'infinity'));
+  create index executions_parent_id_idx on executions (parent_id);
+  create index executions_creator_id_idx on executions (creator_id);
+  create index operations_ts_idx on operations (ts);
+  create index operations_execution_id_idx on operations (execution_id);
+  create index operations_incarnation_id_idx on operations (incarnation_id);
+  create index incarnations_entity_id_idx on incarnations (entity_id);
+  create index incarnations_creator_id_idx on incarnations (creator_id);
+  create index messages_ts_idx on messages (ts);
+  create index messages_interaction_id_idx on messages (interaction_id);
+  create index messages_sender_idx on messages (sender);
+  create index messages_target_idx on messages (target);
+  create index asserts_target_idx on asserts (target);
+
+  $migrate$
+);
+
+-- 15
+call migrate(
+  $migrate$
+
+  -- Compact graph: nodes are interned into bigint ids and verbs are smallints.
+  -- Only forward edges are stored; the inverse verb of verb v has id -v and
+  -- is served from the (target, verb, source) index.
+  create table graph_nodes (
+    node_id bigserial primary key,
+    name text not null unique
+  );
+
+  create table graph_verbs (
+    verb_id smallint primary key,
+    name text not null unique
+  );
+
+  insert into graph_verbs (verb_id, name) values
+    (1, 'reads'),       (-1, 'read_by'),
+    (2, 'writes'),      (-2, 'written_by'),
+    (3, 'child_of'),    (-3, 'parent_of'),
+    (4, 'created_by'),  (-4, 'creator_of'),
+    (5, 'instance_of'), (-5, 'entity_of'),
+    (6, 'part_of'),     (-6, 'divides_into'),
+    (7, 'sent_to'),     (-7, 'received_from'),
+    (8, 'assert'),      (-8, 'assert_reverse'),
+    (9, 'after'),       (-9, 'before');
+
+  create table graph_edges (
+    source bigint not null,
+    verb smallint not null check (verb > 0),
+    target bigint not null,
+    primary key (source, verb, target)
+  );
+  create index graph_edges_reverse_idx on graph_edges (target, verb, source);
+
+  -- Only missing names: on conflict do nothing would still take a node_id
+  -- from the sequence for every candidate row.
+  insert into graph_nodes (name)
+  select x.name from (select source from graph union select target from graph) as x(name)
+   where not exists (select 1 from graph_nodes n where n.name = x.name);
+
+  insert into graph_edges (source, verb, target)
+  select s.node_id, v.verb_id, t.node_id
+    from graph g
+    join graph_verbs v on v.name = g.verb
+    join graph_nodes s on s.name = g.source
+    join graph_nodes t on t.name = g.target
+   where v.verb_id > 0
+  on conflict do nothing;
+
+  drop table graph;
+
+  -- The old text table, both directions, for ad-hoc queries.
+  create view graph (source, verb, target) as
+  select s.name, v.name, t.name
+    from graph_edges e
+    join graph_nodes s on s.node_id = e.source
+    join graph_verbs v on v.verb_id = e.verb
+    join graph_nodes t on t.node_id = e.target
+  union all
+  select t.name, v.name, s.name
+    from graph_edges e
+    join graph_nodes s on s.node_id = e.source
+    join graph_verbs v on v.verb_id = -e.verb
+    join graph_nodes t on t.node_id = e.target;
+
+  -- Forward edges derived from the entity tables.
+  create view graph_triples (source, verb, target) as
+  select execution_id, 'reads'::text, incarnation_id from operations where op_type = 'r'
+  union all
+  select execution_id, 'writes'::text, incarnation_id from operations where op_type = 'w'
+  union all
+  select execution_id, 'child_of'::text, parent_id from executions where parent_id is not null
+  union all
+  select execution_id, 'created_by'::text, creator_id from executions where creator_id is not null
+  union all
+  select incarnation_id, 'instance_of'::text, entity_id from incarnations where entity_id is not null
+  union all
+  select incarnation_id, 'part_of'::text, parent_id from incarnations where parent_id is not null
+  union all
+  select sender, 'sent_to'::text, target from messages
+  union all
+  select t.source, 'assert'::text, t.target from asserts t
+  union all
+  select tt.incarnation_id, 'after'::text, tt.prev_incarnation_id from (
+    select t.incarnation_id, LAG(t.incarnation_id, 1) OVER (partition by t.entity_id order by t.incarnation_id) prev_incarnation_id
+      from incarnations t) as tt
+   where tt.prev_incarnation_id is not null;
+
+  CREATE OR REPLACE PROCEDURE populate_graph()
+  LANGUAGE SQL
+  AS $$
+
+  insert into graph_nodes (name)
+  select x.name from (select source from graph_triples union select target from graph_triples) as x(name)
+   where not exists (select 1 from graph_nodes n where n.name = x.name)
+  on conflict do nothing;
+
+  insert into graph_edges (source, verb, target)
+  select s.node_id, v.verb_id, t.node_id
+    from graph_triples g
+    join graph_verbs v on v.name = g.verb
+    join graph_nodes s on s.name = g.source
+    join graph_nodes t on t.name = g.target
+  on conflict do nothing;
+
+  $$;
+
+  CREATE OR REPLACE FUNCTION graph_forward_verbs(names text[]) RETURNS smallint[] AS $$
+  SELECT coalesce(array_agg(verb_id), array[]::smallint[]) FROM graph_verbs WHERE name = ANY(names) AND verb_id > 0;
+  $$ LANGUAGE sql STABLE;
+
+  CREATE OR REPLACE FUNCTION graph_backward_verbs(names text[]) RETURNS smallint[] AS $$
+  SELECT coalesce(array_agg(-verb_id), array[]::smallint[]) FROM graph_verbs WHERE name = ANY(names) AND verb_id < 0;
+  $$ LANGUAGE sql STABLE;
+
+  CREATE OR REPLACE FUNCTION graph_all_verbs() RETURNS smallint[] AS $$
+  SELECT array_agg(verb_id) FROM graph_verbs WHERE verb_id > 0;
+  $$ LANGUAGE sql STABLE;
+
+  CREATE OR REPLACE FUNCTION graph_verb_ids(names text[]) RETURNS smallint[] AS $$
+  SELECT coalesce(array_agg(verb_id), array[]::smallint[]) FROM graph_verbs WHERE name = ANY(names);
+  $$ LANGUAGE sql STABLE;
+
+  CREATE OR REPLACE FUNCTION graph_node_id(node text) RETURNS bigint AS $$
+  SELECT node_id FROM graph_nodes WHERE name = node;
+  $$ LANGUAGE sql STABLE;
+
+  CREATE OR REPLACE FUNCTION graph_node_name(id bigint) RETURNS text AS $$
+  SELECT name FROM graph_nodes WHERE node_id = id;
+  $$ LANGUAGE sql STABLE;
+
+  CREATE OR REPLACE FUNCTION graph_node_names(ids bigint[]) RETURNS text[] AS $$
+  SELECT ARRAY(SELECT g.name FROM unnest(ids) WITH ORDINALITY AS x(node_id, n) JOIN graph_nodes g USING (node_id) ORDER BY x.n);
+  $$ LANGUAGE sql STABLE;
+
+  CREATE OR REPLACE FUNCTION graph_verb_names(ids smallint[]) RETURNS text[] AS $$
+  SELECT ARRAY(SELECT v.name FROM unnest(ids) WITH ORDINALITY AS x(verb_id, n) JOIN graph_verbs v USING (verb_id) ORDER BY x.n);
+  $$ LANGUAGE sql STABLE;
+
+  -- All simple paths from start_id following forward verbs `fwd` and, in
+  -- reverse, the inverses of `bwd`. Inverse steps carry negative verb ids.
+  CREATE OR REPLACE FUNCTION graph_paths(start_id bigint, fwd smallint[], bwd smallint[], depth_limit integer)
+  RETURNS TABLE(depth integer, verbs smallint[], path bigint[]) AS $$
+  WITH RECURSIVE search_step(link, verb, depth, route, verbs, cycle) AS (
+    SELECT r.target, r.verb, 1,
+           ARRAY[start_id],
+           ARRAY[r.verb],
+           false
+      FROM (SELECT e.verb, e.target FROM graph_edges e WHERE e.source = start_id AND e.verb = ANY(fwd)
+            UNION ALL
+            SELECT -e.verb, e.source FROM graph_edges e WHERE e.target = start_id AND e.verb = ANY(bwd)) r
+
+     UNION ALL
+
+    SELECT r.target, r.verb, sp.depth+1,
+           sp.route || sp.link,
+           sp.verbs || r.verb,
+           sp.link = ANY(sp.route)
+      FROM search_step sp CROSS JOIN LATERAL
+           (SELECT e.verb, e.target FROM graph_edges e WHERE e.source = sp.link AND e.verb = ANY(fwd)
+            UNION ALL
+            SELECT -e.verb, e.source FROM graph_edges e WHERE e.target = sp.link AND e.verb = ANY(bwd)) r
+     WHERE NOT sp.cycle AND sp.depth < depth_limit
+  )
+  SELECT sp.depth, sp.verbs, sp.route || sp.link
+  FROM search_step AS sp
+  WHERE NOT sp.cycle
+  ORDER BY sp.depth ASC;
+  $$ LANGUAGE sql STABLE;
+
+  CREATE OR REPLACE FUNCTION get_shortest_path(start text, destination text, depth_limit integer)
+  RETURNS TABLE(depth integer, path text[], verbs text[]) AS $$
+  SELECT t.depth, graph_node_names(t.path), array_append(graph_verb_names(t.verbs), '<destination>')
+  FROM graph_paths(graph_node_id(start), graph_all_verbs(), graph_all_verbs(), depth_limit) AS t
+  WHERE t.path[array_upper(t.path, 1)] = graph_node_id(destination)
+    AND NOT (graph_node_id(destination) = ANY(t.path[1:array_upper(t.path, 1) - 1]))
+  ORDER BY t.depth ASC;
+  $$ LANGUAGE sql STABLE;
+
+  CREATE OR REPLACE FUNCTION get_all_paths_from(start text, depth_limit integer)
+  RETURNS TABLE(depth integer, verbs text[], path text[]) AS $$
+  SELECT t.depth, array_append(graph_verb_names(t.verbs), '<end>'), graph_node_names(t.path)
+  FROM graph_paths(graph_node_id(start), graph_all_verbs(), graph_all_verbs(), depth_limit) AS t
+  ORDER BY t.depth ASC;
+  $$ LANGUAGE sql STABLE;
+
+  CREATE OR REPLACE FUNCTION get_all_paths_from_by_verbs(start text, crawl_verbs text[], depth_limit integer)
+  RETURNS TABLE(depth integer, verbs text[], path text[]) AS $$
+  SELECT t.depth, array_append(graph_verb_names(t.verbs), '<end>'), graph_node_names(t.path)
+  FROM graph_paths(graph_node_id(start), graph_forward_verbs(crawl_verbs), graph_backward_verbs(crawl_verbs), depth_limit) AS t
+  ORDER BY t.depth ASC;
+  $$ LANGUAGE sql STABLE;
+
+  -- Closures only need the last node, so they skip converting whole paths.
+  create or replace function get_closure_from(start text, depth_limit integer)
+  returns table(depth integer, obj text) as $$
+  select t.depth, graph_node_name(t.path[array_upper(t.path, 1)])
+  from graph_paths(graph_node_id(start), graph_all_verbs(), graph_all_verbs(), depth_limit) as t;
+  $$ language sql stable;
+
+  create or replace function get_closure_from_filtered(start text, filter_verbs text[], depth_limit integer)
+  returns table(depth integer, obj text) as $$
+  select t.depth, graph_node_name(t.path[array_upper(t.path, 1)])
+  from graph_paths(graph_node_id(start), graph_all_verbs(), graph_all_verbs(), depth_limit) as t
+  where t.verbs[array_upper(t.verbs, 1)] = ANY(graph_verb_ids(filter_verbs));
+  $$ language sql stable;
+
+  CREATE OR REPLACE FUNCTION get_closure_from_by_verbs(start text, crawl_verbs text[], depth_limit integer)
+  RETURNS TABLE(depth integer, obj text) AS $$
+  select t.depth, graph_node_name(t.path[array_upper(t.path, 1)])
+  from graph_paths(graph_node_id(start), graph_forward_verbs(crawl_verbs), graph_backward_verbs(crawl_verbs), depth_limit) as t;
+  $$ LANGUAGE sql STABLE;
+
+  CREATE OR REPLACE FUNCTION get_closure_from_by_verbs_filtered(start text, crawl_verbs text[], filter_verbs text[], depth_limit integer)
+  RETURNS TABLE(depth integer, obj text) AS $$
+  select t.depth, graph_node_name(t.path[array_upper(t.path, 1)])
+  from graph_paths(graph_node_id(start), graph_forward_verbs(crawl_verbs), graph_backward_verbs(crawl_verbs), depth_limit) as t
+  where t.verbs[array_upper(t.verbs, 1)] = ANY(graph_verb_ids(filter_verbs));
+  $$ LANGUAGE sql STABLE;
+
+  $migrate$
+);
+
+-- 16
+call migrate(
+  $migrate$
+
+  -- Bumped whenever populate_graph() (or anything else) adds edges, so
+  -- clients can cache query results per version.
+  create table graph_version (
+    version bigint not null
+  );
+  insert into graph_version (version) values (0);
+
+  CREATE OR REPLACE FUNCTION bump_graph_version()
+  RETURNS trigger AS $$
+  BEGIN
+    IF EXISTS (SELECT 1 FROM inserted_edges) THEN
+      UPDATE graph_version SET version = version + 1;
+    END IF;
+    RETURN NULL;
+  END;
+  $$ LANGUAGE plpgsql;
+
+  CREATE TRIGGER graph_edges_version
+  AFTER INSERT ON graph_edges
+  REFERENCING NEW TABLE AS inserted_edges
+  FOR EACH STATEMENT
+  EXECUTE PROCEDURE bump_graph_version();
+
+  $migrate$
+);
+
 
 -- N
 -- call migrate(
@@ -13,10 +13,12 @@ import ulid
 import pprint
 from tenmoTypes import *
 import tenmoGraph
-import tenmoPg
+import tenmoStorage
 import hashlib
 
 src = sys.argv[1]
+# Only the file name, so a log that was moved or copied keeps its ids.
+srcName = os.path.basename(src)
 
 observedActions = collections.defaultdict(list)
 
@@ -29,6 +31,10 @@ for line in fileinput.input(src):
     jsonStr = line[23:]
     act = json.loads(jsonStr)
     act['__ts'] = ts
+    # Ids derived from the line itself make re-importing the same log a no-op.
+    event_ulid = ulid.from_content(
+        float(line[0:17]),
+        ('%s\0%d\0%s\0%s' % (srcName, fileinput.filelineno(), act['action'], line)).encode('utf-8'))
     pprint.pprint(act)
     if 'id' in act:
         observedActions[act['id']].append(act)
@@ -38,7 +44,7 @@ for line in fileinput.input(src):
         if par is not None:
             par = str(par)
         eb = EventExecutionBegins(
-            event_ulid = ulid.ulid(),
+            event_ulid = event_ulid,
             timestamp = ts,
             execution_id = str(act['id']),
             parent_id = par,
@@ -47,7 +53,7 @@ for line in fileinput.input(src):
         tenmoEvents.append(eb)
     elif act['action'] == 'stop':
         ee = EventExecutionEnds(
-                event_ulid = ulid.ulid(),
+                event_ulid = event_ulid,
                 timestamp = ts,
                 execution_id = str(act['id']),
             )
@@ -57,7 +63,7 @@ for line in fileinput.input(src):
     elif act['action'] == 'result':
         if act['type'] == 108: # resConsumed
             nixNso = act['fields'][0]
-            ul = ulid.ulid()
+            ul = event_ulid
             tenmoEvents.append(
                 EventOperation(
                     event_ulid = ul,
@@ -74,7 +80,7 @@ for line in fileinput.input(src):
             )
         elif act['type'] == 109: # resProduced
             nixNso = act['fields'][0]
-            ul = ulid.ulid()
+            ul = event_ulid
             tenmoEvents.append(
                 EventOperation(
                     event_ulid = ul,
@@ -96,7 +102,7 @@ for line in fileinput.input(src):
 
 # pprint.pprint(tenmoEvents)
 
-tenmoPg.send(tenmoEvents, os.environ['TENMO_PGURI'])
+tenmoStorage.connect(os.environ['TENMO_PGURI']).send(tenmoEvents)
 
 # universe = observe(tenmoEvents)
 # pprint.pprint(universe)
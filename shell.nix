@@ -1,6 +1,7 @@
 with (import <nixpkgs> {});
 let
   my-python-packages = python-packages: with python-packages; [
+    numpy
     requests
     psycopg2
     websockets
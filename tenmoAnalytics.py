@@ -0,0 +1,261 @@
+"""
+Duration analytics over the execution tree of a Universe.
+
+Executions become rows of NumPy arrays (begin/end in microseconds, parent
+index) and "X waited on Y" edges (Y is a child of X, or Y wrote an
+incarnation X read). Everything after building the arrays is vectorized,
+except walking the critical path and one pass per tree level.
+"""
+
+import numpy as np
+
+from tenmoTypes import *
+import tenmoSnapshot
+from tenmoSnapshot import ts_micros, TS_NONE, EPOCH
+
+CHILD = 0
+INPUT = 1
+
+
+class Arrays:
+    def __init__(self, ids, descriptions, begin, end, parent, incarnation_ids, op_exec, op_inc, op_write):
+        """
+        `begin`/`end` are microseconds (TS_NONE if unknown), `parent` and
+        `op_exec` index executions (-1 if unknown), `op_inc` indexes
+        `incarnation_ids`.
+        """
+        self.ids = ids
+        self.descriptions = descriptions
+        known = np.concatenate([begin[begin != TS_NONE], end[end != TS_NONE]])
+        horizon = known.max() if len(known) else 0
+        # Executions still running end "now", the latest time we know about.
+        end = np.where(end == TS_NONE, horizon, end)
+        begin = np.where(begin == TS_NONE, end, begin)
+        self.begin = begin
+        self.end = np.maximum(end, begin)
+        self.parent = parent
+        self.incarnation_ids = list(incarnation_ids)
+
+        known = op_exec >= 0
+        op_exec, op_inc, op_write = op_exec[known], op_inc[known], op_write[known]
+        # Writer of each incarnation (the last write wins), -1 if unknown.
+        writer = np.full(len(incarnation_ids), -1, dtype=np.int64)
+        writer[op_inc[op_write]] = op_exec[op_write]
+        r_exec = op_exec[~op_write]
+        r_inc = op_inc[~op_write]
+        r_writer = writer[r_inc]
+        ok = (r_writer >= 0) & (r_writer != r_exec)
+        self.read_exec, self.read_inc, self.read_writer = r_exec[ok], r_inc[ok], r_writer[ok]
+
+        children = np.nonzero(parent >= 0)[0]
+        self.edge_src = np.concatenate([parent[children], self.read_exec])
+        self.edge_dst = np.concatenate([children, self.read_writer])
+        self.edge_kind = np.concatenate([np.full(len(children), CHILD, dtype=np.int8), np.full(len(self.read_exec), INPUT, dtype=np.int8)])
+
+    @classmethod
+    def from_universe(cls, u: Universe):
+        exs = list(u.executions.values())
+        ids = [ex.execution_id for ex in exs]
+        index = dict((eid, n) for n, eid in enumerate(ids))
+        n = len(exs)
+        inc_index = dict()
+        ops = list(u.operations.values())
+        m = len(ops)
+        return cls(
+            ids, [ex.description for ex in exs],
+            np.fromiter((ts_micros(ex.begin_timestamp) for ex in exs), dtype=np.int64, count=n),
+            np.fromiter((ts_micros(ex.end_timestamp) for ex in exs), dtype=np.int64, count=n),
+            np.fromiter((index.get(ex.parent_id, -1) for ex in exs), dtype=np.int64, count=n),
+            inc_index,
+            np.fromiter((index.get(op.execution_id, -1) for op in ops), dtype=np.int64, count=m),
+            np.fromiter((inc_index.setdefault(op.incarnation_id, len(inc_index)) for op in ops), dtype=np.int64, count=m),
+            np.fromiter((op.op_type == 'w' for op in ops), dtype=bool, count=m))
+
+    @classmethod
+    def from_snapshot(cls, path: str):
+        """Builds the arrays straight from a snapshot's columns, see tenmoSnapshot."""
+        manifest, strings, columns = tenmoSnapshot.load_columns(path)
+        exec_col = np.asarray(columns['executions.execution_id'], dtype=np.int64)
+        # String index -> execution row, the extra last slot maps -1 (None) to -1.
+        row = np.full(len(strings), -1, dtype=np.int64)
+        row[exec_col] = np.arange(len(exec_col))
+        op_type = np.asarray(columns['operations.op_type'])
+        w = strings.index('w') if 'w' in strings else -2
+        return cls(
+            [strings[i] for i in exec_col.tolist()],
+            [strings[i] for i in columns['executions.description'].tolist()],
+            np.asarray(columns['executions.begin_timestamp']),
+            np.asarray(columns['executions.end_timestamp']),
+            row[columns['executions.parent_id']],
+            strings,
+            row[columns['operations.execution_id']],
+            np.asarray(columns['operations.incarnation_id'], dtype=np.int64) % len(strings),
+            op_type == w)
+
+
+def self_times(a: Arrays):
+    """
+    Time each execution spent outside of all its children: its duration
+    minus the union of its children's intervals, clipped to its own.
+    """
+    n = len(a.ids)
+    total = a.end - a.begin
+    kids = np.nonzero(a.parent >= 0)[0]
+    if len(kids) == 0:
+        return total.copy()
+    par = a.parent[kids]
+    b = np.clip(a.begin[kids], a.begin[par], a.end[par]) - a.begin[par]
+    e = np.clip(a.end[kids], a.begin[par], a.end[par]) - a.begin[par]
+    order = np.lexsort((b, par))
+    par, b, e = par[order], b[order], e[order]
+    # Shift each parent's group past the previous one, so a single running
+    # maximum over all groups never leaks from one group into the next.
+    starts = np.r_[True, par[1:] != par[:-1]]
+    group = np.cumsum(starts) - 1
+    extent = np.zeros(group[-1] + 1, dtype=np.int64)
+    np.maximum.at(extent, group, e)
+    offset = np.r_[0, np.cumsum(extent + 1)[:-1]][group]
+    b, e = b + offset, e + offset
+    covered_until = np.maximum.accumulate(e)
+    prev = np.r_[np.int64(0), covered_until[:-1]]
+    prev = np.where(starts, b, prev)
+    contribution = np.maximum(e - np.maximum(b, prev), 0)
+    covered = np.bincount(par, weights=contribution, minlength=n).astype(np.int64)
+    return total - covered
+
+
+def subtree_sums(a: Arrays, values):
+    """Sums `values` over each execution's subtree, one vectorized pass per level."""
+    n = len(a.ids)
+    # Pointer jumping: `depth` is the distance from each execution to `up`,
+    # which moves twice as far towards the root every round.
+    up = a.parent.copy()
+    depth = (up >= 0).astype(np.int64)
+    for _ in range(64):
+        live = np.nonzero(up >= 0)[0]
+        if len(live) == 0:
+            break
+        above = up[live]
+        new_depth = depth.copy()
+        new_depth[live] += depth[above]
+        up[live] = up[above]
+        depth = new_depth
+    acc = values.astype(np.int64).copy()
+    for level in range(int(depth.max()) if n else 0, 0, -1):
+        nodes = np.nonzero((depth == level) & (a.parent >= 0))[0]
+        np.add.at(acc, a.parent[nodes], acc[nodes])
+    return acc
+
+
+def critical_path(a: Arrays):
+    """
+    Starting from the execution that ended last, repeatedly steps to what it
+    waited on last: the child or input producer with the latest end.
+    Returns a list of (execution index, edge kind or None).
+    """
+    n = len(a.ids)
+    if n == 0:
+        return []
+    order = np.lexsort((a.end[a.edge_dst], a.edge_src))
+    src, dst, kind = a.edge_src[order], a.edge_dst[order], a.edge_kind[order]
+    last = np.r_[src[1:] != src[:-1], True] if len(src) else np.zeros(0, dtype=bool)
+    blocker = np.full(n, -1, dtype=np.int64)
+    blocker_kind = np.full(n, -1, dtype=np.int8)
+    blocker[src[last]] = dst[last]
+    blocker_kind[src[last]] = kind[last]
+
+    x = int(np.argmax(a.end))
+    path = [(x, None)]
+    seen = {x}
+    while blocker[x] >= 0 and int(blocker[x]) not in seen:
+        k = int(blocker_kind[x])
+        x = int(blocker[x])
+        seen.add(x)
+        path.append((x, k))
+    return path
+
+
+def idle_gaps(a: Arrays):
+    """
+    Intervals in which no leaf execution (one without children) was running.
+    Returns (begin, end) arrays.
+    """
+    n = len(a.ids)
+    has_children = np.zeros(n, dtype=bool)
+    has_children[a.parent[a.parent >= 0]] = True
+    leaves = np.nonzero(~has_children)[0]
+    if len(leaves) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    order = leaves[np.argsort(a.begin[leaves], kind='stable')]
+    b, e = a.begin[order], a.end[order]
+    running_until = np.maximum.accumulate(e)
+    gap = b[1:] > running_until[:-1]
+    return running_until[:-1][gap], b[1:][gap]
+
+
+def waited_on(a: Arrays):
+    """
+    For each incarnation, how long its readers had been running before its
+    writer finished, summed over readers. Returns (total wait, readers) arrays
+    indexed like `a.incarnation_ids`.
+    """
+    m = len(a.incarnation_ids)
+    wait = np.maximum(a.end[a.read_writer] - a.begin[a.read_exec], 0)
+    return (np.bincount(a.read_inc, weights=wait, minlength=m).astype(np.int64),
+            np.bincount(a.read_inc, minlength=m))
+
+
+def _iso(t):
+    return (EPOCH + datetime.timedelta(microseconds=int(t))).isoformat()
+
+def _micros_to_seconds(d):
+    return int(d) / 1e6
+
+def analyze(u: Universe, top=20):
+    """Returns a JSON serializable report, `top` rows for each ranking."""
+    return summarize(Arrays.from_universe(u), top)
+
+def summarize(a: Arrays, top=20):
+    n = len(a.ids)
+    report = {'executions': n}
+    if n == 0:
+        return report
+    total = a.end - a.begin
+    selft = self_times(a)
+    subtree = subtree_sums(a, selft)
+
+    def execution(x):
+        return {'execution_id': a.ids[x],
+                'description': a.descriptions[x],
+                'begin': _iso(a.begin[x]),
+                'end': _iso(a.end[x]),
+                'total': _micros_to_seconds(total[x]),
+                'self': _micros_to_seconds(selft[x]),
+                'subtree_self': _micros_to_seconds(subtree[x])}
+
+    report['wall_time'] = _micros_to_seconds(a.end.max() - a.begin.min())
+
+    path = critical_path(a)
+    steps = []
+    for n_, (x, kind) in enumerate(path):
+        step = execution(x)
+        step['via'] = {None: None, CHILD: 'child', INPUT: 'input'}[kind]
+        if n_ + 1 < len(path):
+            # Time this execution kept the path busy after its blocker ended.
+            step['after_blocker'] = _micros_to_seconds(max(a.end[x] - a.end[path[n_ + 1][0]], 0))
+        if kind == INPUT:
+            waiter = path[n_ - 1][0]
+            step['waited'] = _micros_to_seconds(max(a.end[x] - a.begin[waiter], 0))
+        steps.append(step)
+    report['critical_path'] = steps
+
+    report['top_self'] = [execution(x) for x in np.argsort(-selft, kind='stable')[:top]]
+
+    gb, ge = idle_gaps(a)
+    longest = np.argsort(-(ge - gb), kind='stable')[:top]
+    report['idle_gaps'] = [{'begin': _iso(gb[g]), 'end': _iso(ge[g]), 'duration': _micros_to_seconds(ge[g] - gb[g])} for g in longest]
+
+    wait, readers = waited_on(a)
+    report['most_waited_on'] = [{'incarnation_id': a.incarnation_ids[i], 'wait': _micros_to_seconds(wait[i]), 'readers': int(readers[i])}
+                                for i in np.argsort(-wait, kind='stable')[:top] if wait[i] > 0]
+    return report
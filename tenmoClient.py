@@ -0,0 +1,223 @@
+import atexit
+import collections
+import contextlib
+import contextvars
+import datetime
+import threading
+import traceback
+import pprint
+
+import ulid
+from tenmoTypes import *
+
+# What to do with a new event when the buffer is full.
+DROP = 'drop'    # discard the new event and count it in Client.dropped
+BLOCK = 'block'  # wait until the background thread makes room
+# DROP keeps executions consistent: the end of an execution whose begin was
+# sent is always buffered (past capacity if need be), and everything that
+# depends on a dropped begin (its operations, end and child executions) is
+# dropped too.
+
+current_execution = contextvars.ContextVar('tenmo_current_execution', default=None)
+
+
+def uri_sink(uri: str):
+    import tenmoStorage
+    return tenmoStorage.connect(uri).send
+
+
+class Client:
+    """
+    Buffers events in memory and hands them to `sink` in batches from a
+    background thread, so emitting an event never waits on the database.
+    """
+
+    def __init__(self, sink, capacity=65536, batch_size=512, flush_interval=1.0, policy=DROP, flush_on_exit=True):
+        assert policy in (DROP, BLOCK)
+        self.sink = sink
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.dropped = 0
+        self.dropped_executions = set()
+        # deque.append/popleft are atomic, producers only take a lock when
+        # the buffer is full and the policy is BLOCK.
+        self.buffer = collections.deque()
+        self.sink_lock = threading.Lock()
+        self.space = threading.Condition()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.worker = threading.Thread(target=self._run, name='tenmo-client', daemon=True)
+        self.worker.start()
+        if flush_on_exit:
+            atexit.register(self.close)
+
+    def emit(self, event: Event):
+        buf = self.buffer
+        if self.dropped_executions and self._orphaned(event):
+            self.dropped += 1
+            return False
+        if len(buf) >= self.capacity:
+            if self.policy == DROP:
+                if not isinstance(event, EventExecutionEnds):
+                    if isinstance(event, EventExecutionBegins):
+                        self.dropped_executions.add(event.execution_id)
+                    self.dropped += 1
+                    return False
+            else:
+                self._wait_for_space()
+        buf.append(event)
+        if len(buf) == self.batch_size:
+            self.wakeup.set()
+        return True
+
+    def _orphaned(self, event):
+        """Whether `event` depends on an execution whose begin was dropped."""
+        dropped = self.dropped_executions
+        if isinstance(event, EventExecutionBegins):
+            if event.parent_id in dropped or event.creator_id in dropped:
+                dropped.add(event.execution_id)
+                return True
+        elif isinstance(event, EventExecutionEnds):
+            if event.execution_id in dropped:
+                dropped.discard(event.execution_id)
+                return True
+        elif getattr(event, 'execution_id', None) in dropped:
+            return True
+        return False
+
+    def _wait_for_space(self):
+        buf = self.buffer
+        self.wakeup.set()
+        with self.space:
+            while len(buf) >= self.capacity and not self.closed:
+                self.space.wait(self.flush_interval)
+
+    def _drain(self, everything):
+        buf = self.buffer
+        with self.sink_lock:
+            while buf:
+                batch = []
+                while buf and len(batch) < self.batch_size:
+                    batch.append(buf.popleft())
+                if self.policy == BLOCK:
+                    with self.space:
+                        self.space.notify_all()
+                try:
+                    self.sink(batch)
+                except Exception as e:
+                    pprint.pprint(e)
+                    print(traceback.format_exc())
+                if not everything and len(buf) < self.batch_size:
+                    break
+
+    def _run(self):
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self._drain(everything=False)
+
+    def flush(self):
+        """Synchronously sends everything buffered so far."""
+        self._drain(everything=True)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        with self.space:
+            self.space.notify_all()
+        self.worker.join()
+        self.flush()
+
+
+_client = None
+
+def configure(uri: str = None, sink=None, **kwargs) -> Client:
+    """
+    Sets up the client used by the module level helpers. Either a storage
+    `uri` (see `tenmoStorage.connect`) or a custom `sink` (a callable taking
+    a list of events) has to be given.
+    """
+    global _client
+    if sink is None:
+        sink = uri_sink(uri)
+    if _client is not None:
+        _client.close()
+    _client = Client(sink, **kwargs)
+    return _client
+
+def get_client() -> Client:
+    if _client is None:
+        raise RuntimeError('tenmoClient.configure() has not been called')
+    return _client
+
+def flush():
+    if _client is not None:
+        _client.flush()
+
+
+@contextlib.contextmanager
+def execution(description=None, execution_id=None, parent_id=None, creator_id=None, process_id=None, client=None):
+    """
+    Records an execution spanning the `with` block. Executions started inside
+    the block (in this thread or asyncio task) become its children.
+    """
+    c = client or get_client()
+    if execution_id is None:
+        execution_id = ulid.ulid()
+    if parent_id is None:
+        parent_id = current_execution.get()
+    c.emit(EventExecutionBegins(
+        event_ulid=ulid.ulid(),
+        timestamp=datetime.datetime.now(),
+        execution_id=execution_id,
+        parent_id=parent_id,
+        creator_id=creator_id,
+        process_id=process_id,
+        description=description,
+    ))
+    token = current_execution.set(execution_id)
+    try:
+        yield execution_id
+    finally:
+        current_execution.reset(token)
+        c.emit(EventExecutionEnds(
+            event_ulid=ulid.ulid(),
+            timestamp=datetime.datetime.now(),
+            execution_id=execution_id,
+        ))
+
+def operation(op_type, entity_id, incarnation_id, entity_description=None, incarnation_description=None, execution_id=None, client=None):
+    """
+    Records a read ('r') or write ('w') of `incarnation_id`, a version of
+    `entity_id`. The two must differ, they are separate nodes in the graph.
+    """
+    if incarnation_id == entity_id:
+        raise ValueError('incarnation_id must differ from entity_id %r' % (entity_id,))
+    c = client or get_client()
+    if execution_id is None:
+        execution_id = current_execution.get()
+        if execution_id is None:
+            raise RuntimeError('operation recorded outside of tenmoClient.execution()')
+    ul = ulid.ulid()
+    c.emit(EventOperation(
+        event_ulid=ul,
+        operation_id=ul,
+        timestamp=datetime.datetime.now(),
+        execution_id=execution_id,
+        type=op_type,
+        entity_id=entity_id,
+        incarnation_id=incarnation_id,
+        entity_description=entity_description,
+        incarnation_description=incarnation_description,
+    ))
+    return incarnation_id
+
+def read(entity_id, incarnation_id, **kwargs):
+    return operation('r', entity_id, incarnation_id, **kwargs)
+
+def write(entity_id, incarnation_id, **kwargs):
+    return operation('w', entity_id, incarnation_id, **kwargs)
@@ -72,3 +72,102 @@ def universe_print_dot(u, f=None):
         p('"%s" -> "%s" [weight=5 label="%s" style=dashed penwidth=0.5 arrowsize=.5 labelfontsize=10 color=red];' % (ass.source, ass.target, trim(ass.comment)))
 
     p('}')
+
+
+def universe_edges(u):
+    """Yields (source, verb, target) triples, the same ones `populate_graph()` stores in the graph table."""
+    for op in u.operations.values():
+        if op.op_type == 'r':
+            yield (op.incarnation_id, 'read_by', op.execution_id)
+            yield (op.execution_id, 'reads', op.incarnation_id)
+        elif op.op_type == 'w':
+            yield (op.execution_id, 'writes', op.incarnation_id)
+            yield (op.incarnation_id, 'written_by', op.execution_id)
+    for ex in u.executions.values():
+        if ex.parent_id is not None:
+            yield (ex.execution_id, 'child_of', ex.parent_id)
+            yield (ex.parent_id, 'parent_of', ex.execution_id)
+        if ex.creator_id is not None:
+            yield (ex.execution_id, 'created_by', ex.creator_id)
+            yield (ex.creator_id, 'creator_of', ex.execution_id)
+    for inc in u.incarnations.values():
+        if inc.entity_id is not None:
+            yield (inc.incarnation_id, 'instance_of', inc.entity_id)
+            yield (inc.entity_id, 'entity_of', inc.incarnation_id)
+        if inc.parent_id is not None:
+            yield (inc.incarnation_id, 'part_of', inc.parent_id)
+            yield (inc.parent_id, 'divides_into', inc.incarnation_id)
+    for msg in u.messages.values():
+        yield (msg.sender, 'sent_to', msg.target)
+        yield (msg.target, 'received_from', msg.sender)
+    for ass in u.asserts:
+        yield (ass.source, 'assert', ass.target)
+        yield (ass.target, 'assert_reverse', ass.source)
+    for en in u.entities.values():
+        incs = sorted(en.incarnations)
+        for prev, cur in zip(incs, incs[1:]):
+            yield (cur, 'after', prev)
+            yield (prev, 'before', cur)
+
+
+def edges_index(edges):
+    """Maps source -> list of (verb, target), deduplicating edges."""
+    idx = dict()
+    for e in set(edges):
+        idx.setdefault(e[0], []).append((e[1], e[2]))
+    return idx
+
+
+def closure(idx, start, crawl_verbs=None, filter_verbs=None, depth_limit=100):
+    """
+    In-memory counterpart of `get_closure_from_by_verbs_filtered()`: objects
+    reachable from `start` following `crawl_verbs` (all verbs if None), kept
+    if the last followed verb is in `filter_verbs`. Returns (depth, obj)
+    pairs with the shortest depth for each object.
+    """
+    seen = {start: 0}
+    frontier = [start]
+    found = dict()
+    depth = 0
+    while frontier and depth < depth_limit:
+        depth += 1
+        nxt = []
+        for node in frontier:
+            for verb, target in idx.get(node, ()):
+                if crawl_verbs is not None and verb not in crawl_verbs:
+                    continue
+                if filter_verbs is None or verb in filter_verbs:
+                    found.setdefault(target, depth)
+                if target not in seen:
+                    seen[target] = depth
+                    nxt.append(target)
+        frontier = nxt
+    return sorted(((d, obj) for obj, d in found.items()), key=lambda r: (r[0], r[1]))
+
+
+def shortest_path(idx, start, destination, depth_limit=100):
+    """
+    In-memory counterpart of `get_shortest_path()`, returning only one of
+    the shortest paths as (depth, path, verbs), or None.
+    """
+    prev = {start: None}
+    frontier = [start]
+    depth = 0
+    while frontier and depth < depth_limit:
+        depth += 1
+        nxt = []
+        for node in frontier:
+            for verb, target in idx.get(node, ()):
+                if target in prev:
+                    continue
+                prev[target] = (node, verb)
+                if target == destination:
+                    path, verbs = [target], ['<destination>']
+                    while prev[path[0]] is not None:
+                        node_, verb_ = prev[path[0]]
+                        path.insert(0, node_)
+                        verbs.insert(0, verb_)
+                    return (depth, path, verbs)
+                nxt.append(target)
+        frontier = nxt
+    return None
@@ -0,0 +1,140 @@
+import fcntl
+import json
+import os
+import threading
+import datetime
+
+from tenmoTypes import *
+import tenmoGraph
+from tenmoStorage import Backend
+
+
+class MemoryBackend(Backend):
+    """
+    Keeps events and the universe in memory, applying events with
+    `observe_into` as they are sent. With a `path` every new event is also
+    appended to that file as a JSON line and the file is replayed on start,
+    so separate processes (an importer and `serve`) can share one log.
+    """
+
+    def __init__(self, path=None):
+        self.lock = threading.RLock()
+        self.seen = set()
+        self.universe = empty_universe()
+        self.index = None
+        self.version = 0
+        self.path = path
+        self.offset = 0
+        self.refresh()
+
+    def refresh(self):
+        """Picks up events other processes appended to the file."""
+        if self.path is None or not os.path.exists(self.path):
+            return
+        with self.lock:
+            events, self.offset = self._read(self.offset)
+            self._apply(events)
+
+    def _apply(self, events):
+        new = []
+        for e in events:
+            if e.event_ulid not in self.seen:
+                self.seen.add(e.event_ulid)
+                new.append(e)
+        if new:
+            observe_into(self.universe, new)
+            self.index = None
+            self.version += 1
+        return new
+
+    def send(self, events : Sequence[Event]):
+        with self.lock:
+            self.refresh()
+            new = self._apply(events)
+            if self.path is not None and new:
+                self._append(''.join(json.dumps({'event_type': type(e).__name__, 'payload': e._asdict()}, default=json_default) + '\n'
+                                     for e in new).encode('utf-8'))
+
+    def _append(self, data):
+        # One locked O_APPEND write per batch, so lines of processes sharing
+        # the log never interleave.
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            while data:
+                data = data[os.write(fd, data):]
+        finally:
+            os.close(fd)
+
+    def process_forever(self):
+        # Events are applied when sent, there is nothing left to process.
+        pass
+
+    def load_universe(self, since=None, until=None) -> Universe:
+        self.refresh()
+        return universe_window(self.universe, since, until)
+
+    def graph_edges(self):
+        return [(source, verb, target) for source, es in self.graph_index().items() for verb, target in es]
+
+    def watermark(self):
+        if self.path is None:
+            raise NotImplementedError('watermarks need a memory:///path backend')
+        with self.lock:
+            self.refresh()
+            return {'offset': self.offset}
+
+    def events_since(self, watermark) -> Sequence[Event]:
+        return self._read(watermark['offset'])[0]
+
+    def _read(self, offset):
+        """
+        Returns the events logged after byte `offset` and the offset just past
+        the last complete line, where a half written line will continue.
+        """
+        events = []
+        if not os.path.exists(self.path):
+            return events, offset
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                offset += len(line)
+                try:
+                    d = json.loads(line)
+                    events.append(eventFromDict(d['event_type'], d['payload']))
+                except (ValueError, KeyError, TypeError) as e:
+                    print('skipping bad line at byte %d of %s: %r' % (offset - len(line), self.path, e))
+        return events, offset
+
+    def graph_index(self):
+        with self.lock:
+            self.refresh()
+            if self.index is None:
+                self.index = tenmoGraph.edges_index(tenmoGraph.universe_edges(self.universe))
+            return self.index
+
+    def closure(self, start, crawl_verbs=None, filter_verbs=None, depth_limit=100):
+        return tenmoGraph.closure(self.graph_index(), start, crawl_verbs, filter_verbs, depth_limit)
+
+    def graph_version(self):
+        self.refresh()
+        return self.version
+
+    def query(self, name, args, offset=0, limit=None):
+        idx = self.graph_index()
+        if name == 'shortest_path':
+            found = tenmoGraph.shortest_path(idx, args['start'], args['destination'], args['depth'])
+            rows = [] if found is None else [dict(zip(['depth', 'path', 'verbs'], found))]
+            return rows[offset:None if limit is None else offset + limit]
+        if name == 'provenance_set':
+            rows = tenmoGraph.closure(idx, args['start'], ['written_by', 'reads'], ['reads'], 2)
+        elif name == 'provenance_set_indirect':
+            rows = tenmoGraph.closure(idx, args['start'], ['written_by', 'reads'], ['reads'], args['depth'])
+        elif name == 'trace':
+            rows = tenmoGraph.closure(idx, args['start'], ['child_of'], None, args['depth'])
+        elif name == 'closure':
+            rows = tenmoGraph.closure(idx, args['start'], args['crawl'], args['filter'], args['depth'])
+        rows = rows[offset:None if limit is None else offset + limit]
+        return [{'depth': d, 'obj': o} for d, o in rows]
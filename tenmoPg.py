@@ -5,6 +5,7 @@ import sys
 import threading
 from tenmoTypes import *
 from tenmoGraph import universe_print_dot
+import tenmoStorage
 import select
 import time
 import datetime
@@ -15,14 +16,10 @@ import io
 import json
 import psycopg2
 import psycopg2.extensions
-from psycopg2.extras import Json, DictCursor, RealDictCursor
+from psycopg2.extras import Json, DictCursor, RealDictCursor, execute_values
 
 
 
-def json_default(o):
-    if isinstance(o, (datetime.date, datetime.datetime)):
-        return o.isoformat()
-
 class PgJson(Json):
     def dumps(self, o):
         return json.dumps(o, default=json_default)
@@ -35,13 +32,19 @@ def getPgConn(pgUri: str):
     return conn
 
 def send(events : Sequence[Event], pgUri: str):
+    """
+    Stores events, skipping the ones whose ulid is already known, so sending
+    the same events again neither duplicates them nor wakes up the processor.
+    """
     conn = getPgConn(pgUri)
-    for e in events:
-        event_type = type(e).__name__
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute("INSERT INTO events(ulid, created_at, event_type, payload) VALUES (%s, %s, %s, %s)",
-                            [e.event_ulid, e.timestamp, event_type, PgJson(e._asdict())])
+    batch = dict((e.event_ulid, e) for e in events)
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT ulid FROM events WHERE ulid = ANY(%s::char(26)[])", [list(batch.keys())])
+            for r in cur:
+                del batch[r['ulid']]
+            rows = [(e.event_ulid, e.timestamp, type(e).__name__, PgJson(e._asdict())) for e in batch.values()]
+            execute_values(cur, "INSERT INTO events(ulid, created_at, event_type, payload) VALUES %s ON CONFLICT (ulid) DO NOTHING", rows, page_size=1000)
 
 def listen(pgUri: str, cb):
     conn = getPgConn(pgUri)
@@ -313,7 +316,9 @@ def messageFromPg(row):
 def assertFromPg(row):
     return Assert(**fromPgDict(row))
 
-def load_universe(pgUri: str):
+def load_universe(pgUri: str, since=None, until=None):
+    if since is not None or until is not None:
+        return load_universe_window(pgUri, since, until)
     conn = getPgConn(pgUri)
     with conn:
         with conn.cursor() as c:
@@ -349,24 +354,288 @@ def load_universe(pgUri: str):
         # pprint.pprint(u)
         return u
 
-def serve(pgUri):
+def load_universe_window(pgUri: str, since=None, until=None):
+    """
+    Loads executions running, and operations and messages happening, between
+    `since` and `until` (either can be None), plus the rows they reference
+    directly: parent and creator executions, incarnations and their
+    entities, interactions and processes.
+    """
+    since = since or '-infinity'
+    until = until or 'infinity'
+    conn = getPgConn(pgUri)
+    with conn:
+        with conn.cursor() as c:
+            c.execute("""SELECT * FROM executions
+                         WHERE begin_timestamp <= %s AND COALESCE(end_timestamp, 'infinity') >= %s""",
+                      [until, since])
+            executions = dict( executionFromPg(r) for r in c )
+        with conn.cursor() as c:
+            c.execute("SELECT * FROM operations WHERE ts BETWEEN %s AND %s", [since, until])
+            operations = dict( operationFromPg(r) for r in c )
+        with conn.cursor() as c:
+            c.execute("SELECT * FROM messages WHERE ts BETWEEN %s AND %s", [since, until])
+            messages = dict( messageFromPg(r) for r in c )
+
+        wanted = set()
+        for ex in executions.values():
+            wanted.update((ex.parent_id, ex.creator_id))
+        for op in operations.values():
+            wanted.add(op.execution_id)
+        for m in messages.values():
+            wanted.update((m.sender, m.target))
+        wanted = [i for i in wanted if i is not None and i not in executions]
+        with conn.cursor() as c:
+            c.execute("SELECT * FROM executions WHERE execution_id = ANY(%s)", [wanted])
+            executions.update( executionFromPg(r) for r in c )
+
+        with conn.cursor() as c:
+            c.execute("SELECT * FROM incarnations WHERE incarnation_id = ANY(%s)",
+                      [list(set(op.incarnation_id for op in operations.values()))])
+            incarnations = dict( incarnationFromPg(r) for r in c )
+        with conn.cursor() as c:
+            c.execute("SELECT * FROM processes WHERE process_id = ANY(%s)",
+                      [list(set(ex.process_id for ex in executions.values() if ex.process_id is not None))])
+            processes = dict( processFromPg(r) for r in c )
+        with conn.cursor() as c:
+            c.execute("SELECT * FROM entities WHERE entity_id = ANY(%s)",
+                      [list(set(i.entity_id for i in incarnations.values() if i.entity_id is not None))])
+            entities = dict( entityFromPg(r) for r in c )
+        with conn.cursor() as c:
+            c.execute("SELECT * FROM interactions WHERE interaction_id = ANY(%s)",
+                      [list(set(m.interaction_id for m in messages.values()))])
+            interactions = dict( interactionFromPg(r) for r in c )
+        ids = list(executions.keys()) + list(incarnations.keys()) + list(entities.keys())
+        with conn.cursor() as c:
+            c.execute("SELECT * FROM asserts WHERE source = ANY(%s) OR target = ANY(%s)", [ids, ids])
+            asserts = set( assertFromPg(r) for r in c )
+
+        for iid, i in incarnations.items():
+            if i.entity_id in entities:
+                entities[i.entity_id].incarnations.append(i.incarnation_id)
+        for mid, m in messages.items():
+            interactions[m.interaction_id].messages.append(m.message_id)
+        return Universe(executions=executions, operations=operations, incarnations=incarnations, entities=entities, processes=processes, interactions=interactions, messages=messages, asserts=asserts)
+
+class PgBackend(tenmoStorage.Backend):
+    def __init__(self, pgUri: str):
+        self.pgUri = pgUri
+
+    def send(self, events : Sequence[Event]):
+        send(events, self.pgUri)
+
+    def process_forever(self):
+        process_events_forever(self.pgUri)
+
+    def load_universe(self, since=None, until=None) -> Universe:
+        return load_universe(self.pgUri, since, until)
+
+    def graph_edges(self):
+        conn = getPgConn(self.pgUri)
+        with conn:
+            with conn.cursor() as c:
+                c.execute("SELECT source, verb, target FROM graph")
+                return [(r['source'], r['verb'], r['target']) for r in c]
+
+    def watermark(self):
+        # Processing an event sets its modified time, which only moves
+        # forward, unlike ulids (clients pick those) or the set of pending
+        # events (which can get stuck). The slack covers processing
+        # transactions that started before now() but commit after it.
+        conn = getPgConn(self.pgUri)
+        with conn:
+            with conn.cursor() as c:
+                c.execute("SELECT now() - interval '00:00:10' AS modified")
+                return {'modified': c.fetchone()['modified']}
+
+    def events_since(self, watermark) -> Sequence[Event]:
+        conn = getPgConn(self.pgUri)
+        with conn:
+            with conn.cursor() as c:
+                c.execute("""SELECT * FROM events
+                             WHERE status = 'p' AND modified >= %s
+                             ORDER BY ulid""",
+                          [watermark['modified']])
+                events = [eventFromDict(r['event_type'], r['payload']) for r in c]
+        # Tables hold timestamptz, make event timestamps comparable with them.
+        return [e._replace(timestamp=e.timestamp.astimezone()) if e.timestamp.tzinfo is None else e for e in events]
+
+    def graph_version(self):
+        conn = getPgConn(self.pgUri)
+        with conn:
+            with conn.cursor() as c:
+                c.execute("SELECT version FROM graph_version")
+                return c.fetchone()['version']
+
+    def query(self, name: str, args: dict, offset=0, limit=None):
+        return query(self.pgUri, name, args, offset, limit)
+
+    def closure(self, start, crawl_verbs=None, filter_verbs=None, depth_limit=100):
+        if crawl_verbs is None and filter_verbs is None:
+            fn, args = "get_closure_from(%s, %s)", [start, depth_limit]
+        elif crawl_verbs is None:
+            fn, args = "get_closure_from_filtered(%s, %s, %s)", [start, list(filter_verbs), depth_limit]
+        elif filter_verbs is None:
+            fn, args = "get_closure_from_by_verbs(%s, %s, %s)", [start, list(crawl_verbs), depth_limit]
+        else:
+            fn, args = "get_closure_from_by_verbs_filtered(%s, %s, %s, %s)", [start, list(crawl_verbs), list(filter_verbs), depth_limit]
+        conn = getPgConn(self.pgUri)
+        with conn:
+            with conn.cursor() as c:
+                c.execute(shortest_depths(fn), args)
+                return [(r['depth'], r['obj']) for r in c]
+
+def shortest_depths(fn: str) -> str:
+    """
+    The SQL closure functions return a row per path, this keeps one row per
+    object, at its shortest depth, ordered like `tenmoGraph.closure`.
+    """
+    return """SELECT depth, obj FROM (SELECT DISTINCT ON (obj) depth, obj FROM %s ORDER BY obj, depth) t
+              ORDER BY depth, obj""" % (fn,)
+
+QUERY_SQL = {
+    'provenance_set': shortest_depths("provenance_set(%(start)s)"),
+    'provenance_set_indirect': shortest_depths("provenance_set_indirect(%(start)s, %(depth)s)"),
+    'trace': shortest_depths("trace(%(start)s, %(depth)s)"),
+    'shortest_path': """SELECT depth, path, verbs FROM (SELECT * FROM get_shortest_path(%(start)s, %(destination)s, %(depth)s)
+                                                   ORDER BY depth LIMIT 1) t""",
+    'closure': shortest_depths("get_closure_from_by_verbs_filtered(%(start)s, %(crawl)s, %(filter)s, %(depth)s)"),
+}
+
+def query(pgUri: str, name: str, args: dict, offset=0, limit=None):
+    """
+    Streams the rows of a graph query through a server side cursor, on a
+    connection of its own so it can be consumed slowly.
+    """
+    args = dict(args, offset=offset, limit=limit)
+    for k in ('crawl', 'filter'):
+        if k in args:
+            args[k] = list(args[k] or args['crawl'])
+    conn = psycopg2.connect(pgUri, cursor_factory=RealDictCursor)
+    try:
+        with conn:
+            with conn.cursor(name='tenmo_query') as c:
+                c.itersize = 1000
+                # LIMIT NULL is no limit.
+                c.execute(QUERY_SQL[name] + " OFFSET %(offset)s LIMIT %(limit)s", args)
+                for r in c:
+                    yield dict(r)
+    finally:
+        conn.close()
+
+def serve(backend: tenmoStorage.Backend, snapshotDir: str = None):
     import tenmoServe
 
-    def serveUniverse(pgUri):
+    loaded = None
+    if snapshotDir is not None:
+        import tenmoSnapshot
+        loaded = tenmoSnapshot.load_latest(snapshotDir, backend)
+        if loaded is None:
+            print('no snapshot in %s, loading everything' % (snapshotDir,))
+    state = {'universe': None, 'watermark': None}
+    if loaded is not None:
+        state['universe'], state['watermark'] = loaded
+
+    def currentUniverse(backend, since=None, until=None):
+        if state['universe'] is None:
+            return backend.load_universe(since, until)
+        state['watermark'] = tenmoSnapshot.catch_up(state['universe'], backend, state['watermark'])
+        return universe_window(state['universe'], since, until)
+
+    def queryUniverse(backend, query):
+        since = query.get('from', None)
+        until = query.get('to', None)
+        return currentUniverse(backend,
+                               datetime.datetime.fromisoformat(since) if since else None,
+                               datetime.datetime.fromisoformat(until) if until else None)
+
+    def serveUniverse(backend, query):
         print('serving dot')
         output = io.BytesIO()
-        u = load_universe(pgUri)
-        universe_print_dot(u, output)
+        universe_print_dot(queryUniverse(backend, query), output)
         return output.getvalue()
 
-    tenmoServe.serve(pgUri, '/dot', serveUniverse)
+    def serveAnalytics(backend, query):
+        import tenmoAnalytics
+        print('serving analytics')
+        report = tenmoAnalytics.analyze(queryUniverse(backend, query), int(query.get('top', 20)))
+        return json.dumps(report).encode('utf-8')
+
+    cache = tenmoStorage.QueryCache(backend)
+
+    def serveQuery(name):
+        def cb(backend, query):
+            args = tenmoStorage.query_args(name, query)
+            offset, limit = tenmoStorage.page_args(query)
+            version, page, total, more = cache.page(name, args, offset, limit)
+            res = {'query': name,
+                   'args': args,
+                   'graph_version': version,
+                   'total': total,
+                   'offset': offset,
+                   'rows': page,
+                   'next_offset': offset + len(page) if more else None}
+            return json.dumps(res, default=json_default).encode('utf-8')
+        return cb
+
+    def streamQuery(name):
+        def cb(backend, query):
+            args = tenmoStorage.query_args(name, query)
+            _, size = tenmoStorage.page_args(query)
+            version, rows = cache.get(name, args)
+            page = []
+            sent = 0
+            for r in rows:
+                page.append(r)
+                if len(page) == size:
+                    yield json.dumps({'offset': sent, 'rows': page}, default=json_default)
+                    sent += len(page)
+                    page = []
+            if page:
+                yield json.dumps({'offset': sent, 'rows': page}, default=json_default)
+                sent += len(page)
+            yield json.dumps({'done': True, 'total': sent, 'graph_version': version})
+        return cb
+
+    routes = {'/analytics': ('application/json', serveAnalytics)}
+    wsRoutes = dict()
+    for name in tenmoStorage.QUERIES:
+        routes['/api/%s' % name] = ('application/json', serveQuery(name))
+        wsRoutes['/wsapi/%s' % name] = streamQuery(name)
+
+    tenmoServe.serve(backend, '/dot', serveUniverse, routes=routes, wsRoutes=wsRoutes)
+
+def export(backend: tenmoStorage.Backend, snapshotDir: str):
+    import tenmoSnapshot
+    watermark = backend.watermark()
+    path = tenmoSnapshot.export(backend.load_universe(), backend.graph_edges(), snapshotDir, watermark)
+    print(path)
+
+def analyze(backend: tenmoStorage.Backend, snapshotDir: str = None):
+    import tenmoAnalytics
+    path = None
+    if snapshotDir is not None:
+        import tenmoSnapshot
+        path = tenmoSnapshot.latest(snapshotDir)
+        if path is None:
+            print('no snapshot in %s, analyzing the backend instead' % (snapshotDir,), file=sys.stderr)
+    if path is not None:
+        report = tenmoAnalytics.summarize(tenmoAnalytics.Arrays.from_snapshot(path))
+    else:
+        report = tenmoAnalytics.analyze(backend.load_universe())
+    print(json.dumps(report, indent=1))
 
 if __name__ == "__main__":
+    backend = tenmoStorage.connect(sys.argv[1])
     if sys.argv[2] == 'listen':
         listen(sys.argv[1], print_notify)
     elif sys.argv[2] == 'dot':
-        universe_print_dot(load_universe(sys.argv[1]))
+        universe_print_dot(backend.load_universe())
     elif sys.argv[2] == 'serve':
-        serve(sys.argv[1])
+        serve(backend, sys.argv[3] if len(sys.argv) > 3 else None)
+    elif sys.argv[2] == 'analyze':
+        analyze(backend, sys.argv[3] if len(sys.argv) > 3 else None)
+    elif sys.argv[2] == 'export':
+        export(backend, sys.argv[3])
     elif sys.argv[2] == 'process':
-        process_events_forever(sys.argv[1])
+        backend.process_forever()
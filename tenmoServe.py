@@ -2,10 +2,12 @@ import os
 import functools
 import io
 import json
+import urllib.parse
 from http import HTTPStatus
 import http.server
 import socketserver
 import asyncio
+import concurrent.futures
 import websockets
 
 MIME_TYPES = {
@@ -20,14 +22,25 @@ async def process_request(config, path, request_headers):
     sever_root = config['pwd']
     dotPath = config['dotPath']
     dotCb = config['dotCb']
-    pgUri = config['pgUri']
+    backend = config['backend']
+    executor = config['executor']
 
     if "Upgrade" in request_headers:
         return  # Probably a WebSocket connection
 
-    if path == dotPath:
-        out = dotCb(pgUri)
-        return (HTTPStatus.OK, [('Content-type', 'text/html')], out)
+    url = urllib.parse.urlsplit(path)
+    path = url.path
+    query = dict(urllib.parse.parse_qsl(url.query))
+
+    routes = dict(config['routes'])
+    routes[dotPath] = ('text/html', dotCb)
+    if path in routes:
+        mime_type, cb = routes[path]
+        try:
+            out = await asyncio.get_event_loop().run_in_executor(executor, cb, backend, query)
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, [], str(e).encode('utf-8')
+        return (HTTPStatus.OK, [('Content-type', mime_type)], out)
 
     if path == '/':
         path = '/index.html'
@@ -58,26 +71,53 @@ async def process_request(config, path, request_headers):
     return HTTPStatus.OK, response_headers, body
 
 
-def serve(pgUri, dotPath, dotCb):
+def serve(backend, dotPath, dotCb, routes=None, wsRoutes=None):
+    """
+    `routes` maps extra paths to (mime type, callback), callbacks get the
+    backend and the query string as a dict and return the response body.
+    `wsRoutes` maps websocket paths to callbacks taking the same arguments
+    and returning an iterable of messages to send.
+
+    Callbacks block (on the database), so they run on one worker thread,
+    which also keeps them from using the backend concurrently.
+    """
+    wsRoutes = wsRoutes or {}
     PORT = 8003
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
 
     async def hello(websocket, path):
         print('ws', path)
         # name = await websocket.recv()
-        if path == '/wsdot':
+        url = urllib.parse.urlsplit(path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        loop = asyncio.get_event_loop()
+        if url.path == '/wsdot':
             while True:
-                res = {'dot': dotCb(pgUri).decode("utf-8")}
+                dot = await loop.run_in_executor(executor, dotCb, backend, query)
+                res = {'dot': dot.decode("utf-8")}
                 await websocket.send(json.dumps(res))
                 await asyncio.sleep(1)
-
+        elif url.path in wsRoutes:
+            try:
+                msgs = iter(wsRoutes[url.path](backend, query))
+                while True:
+                    msg = await loop.run_in_executor(executor, next, msgs, None)
+                    if msg is None:
+                        break
+                    await websocket.send(msg)
+            except ValueError as e:
+                await websocket.send(json.dumps({'error': str(e)}))
+            return
 
         await websocket.send("")
 
     handler = functools.partial(process_request,
                                 {'pwd': os.getcwd(),
-                                 'pgUri': pgUri,
+                                 'backend': backend,
                                  'dotPath': dotPath,
                                  'dotCb': dotCb,
+                                 'routes': routes or {},
+                                 'executor': executor,
                                 })
     ip = "0.0.0.0"
     print('Serving at http://%s:%d/' % (ip, PORT))
@@ -0,0 +1,224 @@
+"""
+Columnar snapshots of a Universe and its graph edges.
+
+A snapshot is a directory `snapshot-<ulid>` holding:
+  manifest.json        format version, row counts and the backend watermark
+  strings.bin          every distinct string, utf-8, back to back
+  strings.offsets.npy  int64 byte offset of each string in strings.bin, plus
+                       one past the last
+  <table>.<column>.npy one array per column: int32 indices into the string
+                       table (-1 for None) or int64 microseconds since the
+                       epoch (TS_NONE for None)
+
+The .npy files can be memory-mapped with `numpy.load(..., mmap_mode='r')`,
+see `load_columns`.
+"""
+
+import datetime
+import json
+import os
+
+import numpy as np
+
+from tenmoTypes import *
+import ulid
+
+VERSION = 2
+TS_NONE = np.iinfo(np.int64).min
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Column kinds: 's' string, 't' timestamp, 'j' JSON value stored as a string.
+TABLES = {
+    'executions': (Execution, [('execution_id', 's'), ('begin_timestamp', 't'), ('parent_id', 's'), ('creator_id', 's'), ('process_id', 's'), ('description', 's'), ('end_timestamp', 't')]),
+    'operations': (Operation, [('operation_id', 's'), ('ts', 't'), ('execution_id', 's'), ('op_type', 's'), ('entity_id', 's'), ('incarnation_id', 's'), ('entity_description', 's'), ('incarnation_description', 's')]),
+    'incarnations': (Incarnation, [('incarnation_id', 's'), ('entity_id', 's'), ('parent_id', 's'), ('creator_id', 's'), ('description', 's')]),
+    'entities': (Entity, [('entity_id', 's'), ('description', 's')]),
+    'processes': (Process, [('process_id', 's'), ('description', 's')]),
+    'interactions': (Interaction, [('interaction_id', 's'), ('ts', 't'), ('initiator_participant', 's'), ('responder_participant', 's'), ('description', 's')]),
+    'messages': (Message, [('message_id', 's'), ('interaction_id', 's'), ('ts', 't'), ('sender', 's'), ('target', 's'), ('incarnations_ids', 'j'), ('payload', 'j')]),
+    'asserts': (Assert, [('source', 's'), ('target', 's'), ('comment', 's')]),
+}
+GRAPH_COLUMNS = [('source', 's'), ('verb', 's'), ('target', 's')]
+
+
+class Interner:
+    def __init__(self):
+        self.ids = dict()
+        self.strings = []
+
+    def __call__(self, s):
+        if s is None:
+            return -1
+        i = self.ids.get(s, None)
+        if i is None:
+            i = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+
+def ts_micros(t):
+    """
+    Microseconds since the epoch, TS_NONE for None. Naive timestamps are
+    local time, like Postgres does for timestamptz.
+    """
+    if t is None:
+        return TS_NONE
+    # Doubles are exact to the microsecond for the next couple of centuries.
+    return round(t.timestamp() * 1000000)
+
+def _encode(values, kind, intern):
+    if kind == 's':
+        return np.fromiter((intern(v) for v in values), dtype=np.int32, count=len(values))
+    if kind == 'j':
+        return np.fromiter((intern(None if v is None else json.dumps(v)) for v in values), dtype=np.int32, count=len(values))
+    return np.fromiter((ts_micros(v) for v in values), dtype=np.int64, count=len(values))
+
+def _decode(column, kind, strings, naive):
+    if kind == 's':
+        # strings[-1] is None, so -1 needs no special casing.
+        return [strings[i] for i in column.tolist()]
+    if kind == 'j':
+        return [None if i < 0 else json.loads(strings[i]) for i in column.tolist()]
+    if naive:
+        return [None if t == TS_NONE else datetime.datetime.fromtimestamp(t / 1e6) for t in column.tolist()]
+    return [None if t == TS_NONE else EPOCH + datetime.timedelta(microseconds=t) for t in column.tolist()]
+
+
+def export(u: Universe, edges, directory: str, watermark) -> str:
+    """
+    Writes `u` and the (source, verb, target) `edges` as a new snapshot in
+    `directory` and returns its path. `watermark` is what the backend needs
+    to replay the events that are not reflected in `u`.
+    """
+    intern = Interner()
+    columns = dict()
+    rows = dict()
+    naive = None
+    for table, (_, cols) in TABLES.items():
+        values = getattr(u, table)
+        values = list(values.values()) if isinstance(values, dict) else list(values)
+        rows[table] = len(values)
+        for col, kind in cols:
+            vs = [getattr(v, col) for v in values]
+            if kind == 't' and naive is None:
+                naive = next((v.tzinfo is None for v in vs if v is not None), None)
+            columns['%s.%s' % (table, col)] = _encode(vs, kind, intern)
+    edges = list(edges)
+    rows['graph'] = len(edges)
+    for n, (col, kind) in enumerate(GRAPH_COLUMNS):
+        columns['graph.%s' % col] = _encode([e[n] for e in edges], kind, intern)
+
+    name = 'snapshot-%s' % ulid.ulid()
+    tmp = os.path.join(directory, '.%s.tmp' % name)
+    os.makedirs(tmp)
+    for fname, arr in columns.items():
+        np.save(os.path.join(tmp, fname + '.npy'), arr)
+    encoded = [v.encode('utf-8') for v in intern.strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(os.path.join(tmp, 'strings.offsets.npy'), offsets)
+    with open(os.path.join(tmp, 'strings.bin'), 'wb') as f:
+        f.write(b''.join(encoded))
+    with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+        json.dump({'version': VERSION,
+                   'rows': rows,
+                   'strings': len(intern.strings),
+                   'naive_timestamps': bool(naive),
+                   'watermark': watermark}, f, default=json_default, indent=1)
+    path = os.path.join(directory, name)
+    os.rename(tmp, path)
+    return path
+
+
+def latest(directory: str):
+    """Path of the newest snapshot in `directory`, None if there is none (yet)."""
+    if not os.path.isdir(directory):
+        return None
+    names = sorted(n for n in os.listdir(directory) if n.startswith('snapshot-'))
+    if not names:
+        return None
+    return os.path.join(directory, names[-1])
+
+
+def load_columns(path: str):
+    """
+    Returns (manifest, strings, columns) where `columns` maps 'table.column'
+    to a memory-mapped array. `strings` ends with None, so string columns can
+    be used to index it directly.
+    """
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest['version'] != VERSION:
+        raise ValueError('unsupported snapshot version %r in %s' % (manifest['version'], path))
+    offsets = np.load(os.path.join(path, 'strings.offsets.npy')).tolist()
+    with open(os.path.join(path, 'strings.bin'), 'rb') as f:
+        data = f.read()
+    if len(offsets) != manifest['strings'] + 1 or offsets[-1] != len(data):
+        raise ValueError('corrupt string table in %s' % (path,))
+    strings = [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+    strings.append(None)
+    columns = dict()
+    for table, (_, cols) in list(TABLES.items()) + [('graph', (None, GRAPH_COLUMNS))]:
+        for col, kind in cols:
+            key = '%s.%s' % (table, col)
+            columns[key] = np.load(os.path.join(path, key + '.npy'), mmap_mode='r')
+    return manifest, strings, columns
+
+
+def load(path: str, edges=True):
+    """
+    Returns (universe, edges, watermark) stored in the snapshot at `path`;
+    edges is None unless asked for.
+    """
+    manifest, strings, columns = load_columns(path)
+    naive = manifest['naive_timestamps']
+    tables = dict()
+    for table, (t, cols) in TABLES.items():
+        decoded = [_decode(columns['%s.%s' % (table, col)], kind, strings, naive) for col, kind in cols]
+        names = [col for col, _ in cols]
+        if table == 'asserts':
+            tables[table] = set(t(*r) for r in zip(*decoded))
+            continue
+        items = dict()
+        for r in zip(*decoded):
+            d = dict(zip(names, r))
+            if table == 'entities':
+                d['incarnations'] = []
+            elif table == 'interactions':
+                d['messages'] = []
+            items[r[0]] = t(**d)
+        tables[table] = items
+    u = Universe(**tables)
+    for iid, i in u.incarnations.items():
+        if i.entity_id in u.entities:
+            u.entities[i.entity_id].incarnations.append(iid)
+    for mid, m in u.messages.items():
+        if m.interaction_id in u.interactions:
+            u.interactions[m.interaction_id].messages.append(mid)
+    if edges:
+        edges = list(zip(*[_decode(columns['graph.%s' % col], kind, strings, naive) for col, kind in GRAPH_COLUMNS]))
+    else:
+        edges = None
+    return u, edges, manifest['watermark']
+
+
+def load_latest(directory: str, backend=None):
+    """
+    Loads the newest snapshot in `directory` and, given a backend, applies
+    the events it stored since the snapshot was taken. Returns (universe,
+    watermark) or None if there is no snapshot yet.
+    """
+    path = latest(directory)
+    if path is None:
+        return None
+    u, _, watermark = load(path, edges=False)
+    if backend is not None:
+        watermark = catch_up(u, backend, watermark)
+    return u, watermark
+
+
+def catch_up(u: Universe, backend, watermark):
+    """Applies events stored since `watermark` to `u`, returns the new watermark."""
+    new_watermark = backend.watermark()
+    observe_into(u, backend.events_since(watermark))
+    return new_watermark
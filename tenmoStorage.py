@@ -0,0 +1,200 @@
+import collections
+import itertools
+import threading
+
+from tenmoTypes import *
+
+# Graph queries served by `Backend.query`, with their parameters. They mirror
+# the SQL functions of the same (or, for shortest_path and closure, the
+# get_shortest_path and get_closure_from_by_verbs_filtered) name.
+QUERIES = {
+    'provenance_set': ['start'],
+    'provenance_set_indirect': ['start', 'depth'],
+    'trace': ['start', 'depth'],
+    'shortest_path': ['start', 'destination', 'depth'],
+    'closure': ['start', 'crawl', 'filter', 'depth'],
+}
+
+
+class Backend:
+    """
+    Storage for tenmo events and the universe derived from them.
+
+    `tenmoPg.PgBackend` keeps everything in Postgres and derives the universe
+    in a separate `process` worker, `tenmoMemory.MemoryBackend` keeps it in
+    the current process and derives it as events are sent.
+    """
+
+    def send(self, events : Sequence[Event]):
+        raise NotImplementedError
+
+    def process_forever(self):
+        """Turns stored events into the universe until interrupted."""
+        raise NotImplementedError
+
+    def load_universe(self, since=None, until=None) -> Universe:
+        """
+        The whole universe, or with `since`/`until` only what happened in
+        that time window and what it directly references (see
+        `tenmoTypes.universe_window`).
+        """
+        raise NotImplementedError
+
+    def graph_edges(self):
+        """All (source, verb, target) triples of the graph."""
+        raise NotImplementedError
+
+    def watermark(self):
+        """
+        An opaque, JSON serializable position in the event stream. Taken
+        before loading the universe, `events_since` of it returns (at least)
+        every event the loaded universe may be missing.
+        """
+        raise NotImplementedError
+
+    def events_since(self, watermark) -> Sequence[Event]:
+        raise NotImplementedError
+
+    def closure(self, start, crawl_verbs=None, filter_verbs=None, depth_limit=100):
+        """
+        Objects reachable from `start` in the graph, see
+        `get_closure_from_by_verbs_filtered()` in database.sql. Returns a
+        list of (depth, obj) pairs, one per object at the shortest depth it
+        is reachable at, ordered by depth and obj.
+        """
+        raise NotImplementedError
+
+    def graph_version(self):
+        """Changes whenever edges are added to the graph."""
+        raise NotImplementedError
+
+    def query(self, name: str, args: dict, offset=0, limit=None):
+        """
+        Runs one of QUERIES with arguments from `query_args`, returning an
+        iterable of JSON serializable rows, skipping the first `offset` and
+        stopping after `limit` of them. Closure queries (all but
+        shortest_path) yield {depth, obj} rows like `closure`; shortest_path
+        yields at most one {depth, path, verbs} row, for one of the shortest
+        paths.
+        """
+        raise NotImplementedError
+
+
+def query_args(name: str, params: dict) -> dict:
+    """
+    Validates and converts query string parameters of query `name`; verb
+    lists are comma separated. Raises ValueError on bad input.
+    """
+    if name not in QUERIES:
+        raise ValueError('unknown query %r' % (name,))
+    args = dict()
+    for p in QUERIES[name]:
+        v = params.get(p, None)
+        if p == 'depth':
+            args[p] = int(v) if v is not None else 100
+        elif p in ('crawl', 'filter'):
+            args[p] = tuple(x for x in v.split(',') if x) if v else None
+        elif v is None:
+            raise ValueError('missing parameter %r' % (p,))
+        else:
+            args[p] = v
+    if name == 'closure' and args['crawl'] is None:
+        raise ValueError('missing parameter %r' % ('crawl',))
+    return args
+
+
+def page_args(params: dict):
+    """
+    Returns (offset, limit) from query string parameters. Raises ValueError
+    unless offset >= 0 and limit >= 1.
+    """
+    offset = int(params.get('offset', 0))
+    limit = int(params.get('limit', 1000))
+    if offset < 0:
+        raise ValueError('offset must not be negative')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return offset, limit
+
+
+class QueryCache:
+    """
+    LRU cache of `Backend.query` results keyed by (query, args, graph
+    version). A new graph version drops all entries, as they can no longer
+    be hit. Results longer than `max_rows` are not cached.
+    """
+
+    def __init__(self, backend: Backend, max_entries=256, max_rows=100000):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.entries = collections.OrderedDict()
+        self.version = None
+        # Keys of this version known to exceed max_rows.
+        self.oversized = set()
+        self.lock = threading.Lock()
+
+    def _lookup(self, name, args):
+        version = self.backend.graph_version()
+        key = (name, tuple(sorted(args.items())))
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.oversized.clear()
+                self.version = version
+            rows = self.entries.get(key, None)
+            if rows is not None:
+                self.entries.move_to_end(key)
+            return version, key, rows, key in self.oversized
+
+    def get(self, name: str, args: dict):
+        """Returns (graph version, rows); rows is a list or, if uncached, an iterator."""
+        version, key, rows, oversized = self._lookup(name, args)
+        if rows is not None:
+            return version, rows
+        rows = iter(self.backend.query(name, args))
+        if oversized:
+            return version, rows
+        head = []
+        for r in rows:
+            head.append(r)
+            if len(head) > self.max_rows:
+                with self.lock:
+                    if version == self.version:
+                        self.oversized.add(key)
+                return version, itertools.chain(head, rows)
+        with self.lock:
+            if version == self.version:
+                self.entries[key] = head
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return version, head
+
+    def page(self, name: str, args: dict, offset: int, limit: int):
+        """
+        Returns (graph version, rows, total, more): `limit` rows from
+        `offset` on, whether there are more after them and, unless the
+        result is too large to cache, the total number of rows.
+        """
+        version, key, rows, oversized = self._lookup(name, args)
+        if rows is None and not oversized:
+            version, rows = self.get(name, args)
+        if isinstance(rows, list):
+            return version, rows[offset:offset + limit], len(rows), offset + limit < len(rows)
+        # Too large to cache: have the backend skip to the page.
+        rows = list(self.backend.query(name, args, offset, limit + 1))
+        return version, rows[:limit], None, len(rows) > limit
+
+
+def connect(uri: str) -> Backend:
+    """
+    Returns a backend for `uri`:
+      memory://                 in-memory, lost at exit
+      memory:///path/log.jsonl  in-memory, persisted to (and loaded from) a file
+      anything else             a Postgres connection string
+    """
+    if uri.startswith('memory://'):
+        import tenmoMemory
+        return tenmoMemory.MemoryBackend(uri[len('memory://'):] or None)
+    import tenmoPg
+    return tenmoPg.PgBackend(uri)
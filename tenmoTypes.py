@@ -99,6 +99,10 @@ Message = collections.namedtuple(
      'target',
      'incarnations_ids',
      'payload'], defaults=[None, None])
+Process = collections.namedtuple(
+    'Process',
+    ['process_id',
+     'description'], defaults=[None])
 Assert = collections.namedtuple(
     'Assert',
     ['source',
@@ -108,20 +112,40 @@ Assert = collections.namedtuple(
 
 Universe = collections.namedtuple('Universe', ['executions', 'operations', 'incarnations', 'entities', 'processes', 'interactions', 'messages', 'asserts'])
 
+def json_default(o):
+    if isinstance(o, (datetime.date, datetime.datetime)):
+        return o.isoformat()
 
-def observe(events : Sequence[Event]) -> Universe:
+
+EVENT_TYPES = dict((t.__name__, t) for t in [EventExecutionBegins, EventExecutionEnds, EventOperation, EventMessage])
+
+
+def eventFromDict(event_type: str, payload: dict) -> Event:
+    """Inverse of `e._asdict()` after a JSON round trip."""
+    t = EVENT_TYPES[event_type]
+    d = dict((k, v) for k, v in payload.items() if k in t._fields)
+    if isinstance(d.get('timestamp'), str):
+        d['timestamp'] = datetime.datetime.fromisoformat(d['timestamp'])
+    return t(**d)
+
+
+def empty_universe() -> Universe:
+    return Universe(executions=dict(), operations=dict(), incarnations=dict(), entities=dict(), processes=dict(), interactions=dict(), messages=dict(), asserts=set())
+
+
+def observe_into(u: Universe, events : Sequence[Event]) -> Universe:
+    """
+    Applies events to an existing universe. Events can be applied in batches
+    as they arrive, and applying the same event twice has no effect.
+    """
     global strict
-    executions = dict()
-    operations = dict()
-    incarnations = dict()
-    entities = dict()
-    processes = dict()
-    interactions = dict()
-    messages = dict()
-    asserts = dict()
-    u = Universe(executions=executions, operations=operations, incarnations=incarnations, entities=entities, processes=processes, interactions=interactions, messages=messages, asserts=asserts)
+    executions = u.executions
+    operations = u.operations
+    incarnations = u.incarnations
+    entities = u.entities
     for e in events:
         if isinstance(e, EventExecutionBegins):
+            ex = executions.get(e.execution_id, None)
             executions[e.execution_id] = Execution(
                 execution_id=e.execution_id,
                 begin_timestamp=e.timestamp,
@@ -129,26 +153,110 @@ def observe(events : Sequence[Event]) -> Universe:
                 creator_id=e.creator_id,
                 process_id=e.process_id,
                 description=e.description,
-                end_timestamp=None,
+                end_timestamp=ex.end_timestamp if ex is not None else None,
             )
+            if e.process_id is not None and e.process_id not in u.processes:
+                u.processes[e.process_id] = Process(process_id=e.process_id)
         elif isinstance(e, EventExecutionEnds):
-            ex = executions[e.execution_id]
+            ex = executions.get(e.execution_id, None)
+            if ex is None:
+                # The end arrived first, the begin event will fill in the rest.
+                ex = Execution(execution_id=e.execution_id, begin_timestamp=None, parent_id=None, creator_id=None, process_id=None, description=None)
             executions[ex.execution_id] = ex._replace(end_timestamp = e.timestamp)
 
     for e in events:
         if isinstance(e, EventOperation):
-            operations[e.event_ulid] = Operation(**dict(e._asdict()))
+            operations[e.operation_id] = Operation(
+                operation_id=e.operation_id,
+                ts=e.timestamp,
+                execution_id=e.execution_id,
+                op_type=e.type,
+                entity_id=e.entity_id,
+                incarnation_id=e.incarnation_id,
+                entity_description=e.entity_description,
+                incarnation_description=e.incarnation_description)
             if (strict and (e.type == 'w' and e.incarnation_id not in incarnations)) or (not strict and (e.type in ['w', 'r'])):
-                entities[e.entity_id] = entities.get(e.entity_id, Entity(entity_id=e.entity_id, description=e.entity_description, incarnations=[]))
-                incarnations[e.incarnation_id] = Incarnation(incarnation_id=e.incarnation_id, entity_id=e.entity_id, creator_id=e.execution_id, description=e.incarnation_description)
-                entities[e.entity_id].incarnations.append(e.incarnation_id)
+                if e.entity_id not in entities:
+                    entities[e.entity_id] = Entity(entity_id=e.entity_id, description=e.entity_description, incarnations=[])
+                old = incarnations.get(e.incarnation_id, None)
+                creator_id = e.execution_id if e.type == 'w' else None
+                if old is None:
+                    entities[e.entity_id].incarnations.append(e.incarnation_id)
+                    incarnations[e.incarnation_id] = Incarnation(incarnation_id=e.incarnation_id, entity_id=e.entity_id, parent_id=None, creator_id=creator_id, description=e.incarnation_description)
+                elif old.creator_id is None and creator_id is not None:
+                    incarnations[e.incarnation_id] = old._replace(creator_id=creator_id)
+        elif isinstance(e, EventMessage):
+            inter = u.interactions.get(e.interaction_id, None)
+            if inter is None:
+                inter = Interaction(interaction_id=e.interaction_id, ts=e.timestamp, initiator_participant=e.sender, responder_participant=e.target, messages=[], description=e.interaction_description)
+                u.interactions[e.interaction_id] = inter
+            if e.message_id not in u.messages:
+                inter.messages.append(e.message_id)
+            u.messages[e.message_id] = Message(message_id=e.message_id, interaction_id=e.interaction_id, ts=e.timestamp, sender=e.sender, target=e.target, incarnations_ids=e.incarnations_ids, payload=e.payload)
 
     if strict:
         for e in events:
             if isinstance(e, EventOperation):
-                operations[e.event_ulid] = e
                 i = incarnations.get(e.incarnation_id, None)
                 if e.type == 'r':
                     assert i is not None
 
     return u
+
+
+def observe(events : Sequence[Event]) -> Universe:
+    return observe_into(empty_universe(), events)
+
+
+def universe_window(u: Universe, since=None, until=None) -> Universe:
+    """
+    Executions running, and operations and messages happening, between
+    `since` and `until` (either can be None), plus everything they reference
+    directly. Returns `u` itself if there are no bounds.
+    """
+    if since is None and until is None:
+        return u
+    from tenmoSnapshot import ts_micros
+    lo = ts_micros(since) if since is not None else float('-inf')
+    hi = ts_micros(until) if until is not None else float('inf')
+
+    def inside(t):
+        return t is not None and lo <= ts_micros(t) <= hi
+
+    executions = dict()
+    for eid, ex in u.executions.items():
+        begin = ts_micros(ex.begin_timestamp) if ex.begin_timestamp is not None else float('-inf')
+        end = ts_micros(ex.end_timestamp) if ex.end_timestamp is not None else float('inf')
+        if begin <= hi and end >= lo:
+            executions[eid] = ex
+    operations = dict((oid, op) for oid, op in u.operations.items() if inside(op.ts))
+    messages = dict((mid, m) for mid, m in u.messages.items() if inside(m.ts))
+
+    wanted = set()
+    for ex in executions.values():
+        wanted.update((ex.parent_id, ex.creator_id))
+    for op in operations.values():
+        wanted.add(op.execution_id)
+    for m in messages.values():
+        wanted.update((m.sender, m.target))
+    for eid in wanted:
+        if eid in u.executions:
+            executions[eid] = u.executions[eid]
+
+    incarnations = dict((op.incarnation_id, u.incarnations[op.incarnation_id]) for op in operations.values() if op.incarnation_id in u.incarnations)
+    entities = dict()
+    for i in incarnations.values():
+        if i.entity_id in u.entities and i.entity_id not in entities:
+            entities[i.entity_id] = u.entities[i.entity_id]._replace(incarnations=[])
+        if i.entity_id in entities:
+            entities[i.entity_id].incarnations.append(i.incarnation_id)
+    interactions = dict()
+    for m in messages.values():
+        if m.interaction_id in u.interactions and m.interaction_id not in interactions:
+            interactions[m.interaction_id] = u.interactions[m.interaction_id]._replace(messages=[])
+        if m.interaction_id in interactions:
+            interactions[m.interaction_id].messages.append(m.message_id)
+    processes = dict((ex.process_id, u.processes[ex.process_id]) for ex in executions.values() if ex.process_id in u.processes)
+    ids = set(executions) | set(incarnations) | set(entities)
+    asserts = set(a for a in u.asserts if a.source in ids or a.target in ids)
+    return Universe(executions=executions, operations=operations, incarnations=incarnations, entities=entities, processes=processes, interactions=interactions, messages=messages, asserts=asserts)
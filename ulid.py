@@ -6,6 +6,7 @@ import os
 import sys
 import time
 import codecs
+import hashlib
 
 ENCODING = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
 LENCODING = len(ENCODING)
@@ -20,15 +21,18 @@ def encode_time_10bytes(x):
         s = ENCODING[i] + s
     return s
 
-def encode_random_16bytes():
-    b = os.urandom(10)
-    x = int(codecs.encode(b, 'hex') if PY3 else b.encode('hex'), 16)
+def encode_16chars(x):
+    """ encode an 80 bit integer as 16 characters """
     s = ''
     while len(s) < 16:
         x, i = divmod(x, LENCODING)
         s = ENCODING[i] + s
     return s
 
+def encode_random_16bytes():
+    b = os.urandom(10)
+    return encode_16chars(int(codecs.encode(b, 'hex') if PY3 else b.encode('hex'), 16))
+
 def convert(chars):
     i = 0
     n = len(chars)-1
@@ -47,6 +51,11 @@ def sharding(ulid, partitions):
 def ulid():
     return encode_time_10bytes(int(time.time()*1000)) + encode_random_16bytes()
 
+def from_content(seconds, content):
+    """ return a deterministic ulid for the timestamp and content (bytes) """
+    x = int(codecs.encode(hashlib.sha256(content).digest()[:10], 'hex'), 16)
+    return encode_time_10bytes(int(seconds*1000)) + encode_16chars(x)
+
 def main():
     for _ in range(10):
         print(ulid())